@@ -1,47 +1,271 @@
 import os
 import time
 from flask import Flask, request, jsonify, Response
-from PIL import Image
+from PIL import Image, features as pil_features
 import cloudinary
 import cloudinary.uploader
 import io
 import tempfile
 import logging
 import subprocess
+import shutil
 import threading
-import queue
 import uuid
 import mimetypes
 from werkzeug.utils import secure_filename
 from functools import wraps
 import redis
 import json
+import urllib3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from celery import Celery
 
 # --- Logging Configuration ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Verify that Pillow is linked against libjpeg-turbo (SIMD JPEG encode/decode).
+# With pillow-simd + libjpeg-turbo the JPEG DCT, color-conversion and Huffman
+# stages run on AVX2/SSE2/NEON kernels, which is where compress_image spends
+# most of its CPU time.
+try:
+    if pil_features.check_feature('libjpeg_turbo'):
+        logger.info("Pillow is using libjpeg-turbo (SIMD-accelerated JPEG codec)")
+    else:
+        logger.warning("Pillow is NOT using libjpeg-turbo; image compression will be slower. "
+                       "Install pillow-simd with libjpeg-turbo-dev for best performance.")
+except Exception:
+    # Older Pillow versions don't expose the libjpeg_turbo feature flag.
+    logger.warning("Could not determine whether Pillow uses libjpeg-turbo")
+
+# pillow-simd versions carry a '.postN' suffix (e.g. 9.0.0.post1); its SIMD
+# resampling kernels also speed up the LANCZOS thumbnail pass, so flag a
+# stock Pillow that slipped back in through a dependency re-resolve.
+if 'post' not in getattr(Image, '__version__', ''):
+    logger.warning(f"Stock Pillow {getattr(Image, '__version__', 'unknown')} detected "
+                   "(expected a pillow-simd '.postN' build); resampling will not be SIMD-accelerated")
+
+# Optional direct libjpeg-turbo codec. PyTurboJPEG produces the JPEG bytes in
+# a single native call, skipping PIL's Python-level mode probing, the extra
+# RGBA->RGB image allocation and the BytesIO growth reallocations. If the
+# library (or libturbojpeg itself) is missing we silently fall back to Pillow.
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420, TJFLAG_FASTDCT
+    import numpy as np
+    _turbojpeg = TurboJPEG()
+    logger.info("TurboJPEG initialized; encoding JPEGs directly via libjpeg-turbo")
+except Exception as e:
+    _turbojpeg = None
+    logger.warning(f"TurboJPEG unavailable ({e}); using Pillow for JPEG encoding")
+
+# Optional libmagic content sniffing. python-magic parses container
+# structure in native code, well beyond a fixed byte prefix, so it can
+# classify formats the built-in signature table cannot - and costs nothing
+# next to reading the upload itself. Falls back to the table if missing.
+try:
+    import magic
+    _magic = magic.Magic(mime=True)
+    logger.info("python-magic initialized; validating uploads via libmagic")
+except Exception as e:
+    _magic = None
+    logger.warning(f"python-magic unavailable ({e}); using the built-in signature table")
+
 # --- Configuration ---
 # IMPORTANT: Replace with your actual Cloudinary credentials
 CLOUDINARY_CLOUD_NAME = os.environ.get('CLOUDINARY_CLOUD_NAME', 'your_cloud_name')
 CLOUDINARY_API_KEY = os.environ.get('CLOUDINARY_API_KEY', 'your_api_key')
 CLOUDINARY_API_SECRET = os.environ.get('CLOUDINARY_API_SECRET', 'your_api_secret')
 
-# Redis for job tracking and caching
+# Redis for job tracking and caching. Every SSE client holds a dedicated
+# pub/sub connection for the life of its stream, so the pool has to cover
+# the full per-worker connection budget (gunicorn's worker_connections
+# under the gevent class, shared via the WORKER_CONNECTIONS env var) plus
+# a margin for request handlers - sized for worker threads alone, the
+# stream after the cap got a ConnectionError mid-response. Connections
+# are created lazily, so the high cap costs nothing when idle; keepalive
+# and periodic health checks reap dead sockets instead of letting a
+# request discover them.
 REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
-redis_client = redis.from_url(REDIS_URL)
+WORKER_CONNECTIONS = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+redis_pool = redis.ConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=int(os.environ.get(
+        'REDIS_MAX_CONNECTIONS',
+        WORKER_CONNECTIONS + int(os.environ.get('MAX_WORKER_THREADS', 5)) * 4 + 32
+    )),
+    socket_keepalive=True,
+    health_check_interval=30
+)
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+# Longest edge kept when re-encoding images. Encode cost scales with pixel
+# count, so clamping a 24 MP phone photo to 2048px is roughly a 9x reduction
+# in encoder work and upload bytes.
+IMAGE_MAX_EDGE = int(os.environ.get('IMAGE_MAX_EDGE', 2048))
+
+# JPEGs at or below this size that already fit the dimension box are
+# forwarded untouched: re-encoding a well-compressed JPEG burns CPU for a
+# same-size (often larger) file plus a second generation of quality loss.
+IMAGE_PASSTHROUGH_MAX_BYTES = int(os.environ.get('IMAGE_PASSTHROUGH_MAX_BYTES', 500 * 1024))
+
+# Compressed images larger than this spill from memory to a temp file, so
+# the Cloudinary upload streams from a file handle in small chunks instead
+# of holding (and copying) the whole JPEG in the Python heap.
+IMAGE_SPOOL_MAX_BYTES = int(os.environ.get('IMAGE_SPOOL_MAX_BYTES', 2 * 1024 * 1024))
+
+# When disabled, images are streamed to Cloudinary untouched and
+# q_auto:eco/f_auto do the compression server-side - zero local image CPU.
+# Worth turning off when the app sits close to Cloudinary and bandwidth is
+# cheaper than compute.
+LOCAL_IMAGE_COMPRESS = os.environ.get('LOCAL_IMAGE_COMPRESS', '1') == '1'
+
+# Chunk size for Cloudinary's resumable upload_large video transfers.
+# Larger chunks mean fewer Content-Range round-trips per upload; 20 MB
+# keeps the per-chunk HTTP overhead small on high-latency links while
+# bounding how much of the stream is resident per in-flight chunk.
+CLOUDINARY_CHUNK_SIZE = int(os.environ.get('CLOUDINARY_CHUNK_SIZE', 20 * 1024 * 1024))
 
 # File upload settings
 MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 100 * 1024 * 1024))  # 100MB max by default
-ALLOWED_IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
-ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi', 'mkv', 'webm'}
-ALLOWED_EXTENSIONS = ALLOWED_IMAGE_EXTENSIONS.union(ALLOWED_VIDEO_EXTENSIONS)
+ALLOWED_IMAGE_EXTENSIONS = frozenset({'jpg', 'jpeg', 'png', 'gif', 'webp'})
+ALLOWED_VIDEO_EXTENSIONS = frozenset({'mp4', 'mov', 'avi', 'mkv', 'webm'})
 
-# Processing queue and settings
-video_processing_queue = queue.Queue()
+# Processing settings
 MAX_WORKER_THREADS = int(os.environ.get('MAX_WORKER_THREADS', 5))
 JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 3600))  # 1 hour timeout for jobs
 
+# Temp storage for uploads in flight. On many distros /tmp is RAM-backed
+# tmpfs, so a multi-GB video upload can eat the host's memory and OOM the
+# process; point tempfile at a directory on real disk instead. Stale files
+# left behind by crashed jobs are swept periodically, but only when we own
+# the directory - never from a shared system tempdir.
+UPLOAD_TMP_DIR = os.environ.get('UPLOAD_TMP_DIR', '/var/cache/compressor')
+UPLOAD_TMP_MAX_AGE = int(os.environ.get('UPLOAD_TMP_MAX_AGE', 2 * JOB_TIMEOUT))
+UPLOAD_TMP_SWEEP_INTERVAL = int(os.environ.get('UPLOAD_TMP_SWEEP_INTERVAL', 300))
+
+def _sweep_stale_temp_files():
+    """Periodically remove upload temp files older than UPLOAD_TMP_MAX_AGE."""
+    while True:
+        time.sleep(UPLOAD_TMP_SWEEP_INTERVAL)
+        cutoff = time.time() - UPLOAD_TMP_MAX_AGE
+        try:
+            with os.scandir(UPLOAD_TMP_DIR) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file() and entry.stat().st_mtime < cutoff:
+                            os.unlink(entry.path)
+                            logger.info(f"Removed stale temp file: {entry.path}")
+                    except OSError:
+                        pass
+        except OSError as e:
+            logger.warning(f"Temp sweep of {UPLOAD_TMP_DIR} failed: {e}")
+
+try:
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    tempfile.tempdir = UPLOAD_TMP_DIR
+    threading.Thread(target=_sweep_stale_temp_files, daemon=True).start()
+    logger.info(f"Upload temp files go to {UPLOAD_TMP_DIR} (swept after {UPLOAD_TMP_MAX_AGE}s)")
+except OSError as e:
+    logger.warning(f"Could not use {UPLOAD_TMP_DIR} for uploads ({e}); using the system tempdir")
+
+# Celery task queue. Video jobs run in separate worker processes so request
+# threads are held for milliseconds instead of the full ffmpeg run; throughput
+# then scales with worker count rather than Flask workers. Run workers with:
+#   celery -A app.celery_app worker -Q video --concurrency 4
+# (prefer a few large workers over many small ones - Celery's per-message
+# overhead dominates otherwise). Image work stays synchronous in the request
+# for now; route it to a separate 'image' queue if it ever moves off-thread.
+celery_app = Celery('compress', broker=REDIS_URL, backend=REDIS_URL)
+celery_app.conf.task_routes = {'compress.*': {'queue': 'video'}}
+# Ack only after the job finishes so a crashed worker's jobs are redelivered
+# instead of silently dropped, and cap runaway encodes at the job timeout.
+celery_app.conf.task_acks_late = True
+celery_app.conf.task_reject_on_worker_lost = True
+celery_app.conf.task_time_limit = JOB_TIMEOUT
+celery_app.conf.task_soft_time_limit = max(60, JOB_TIMEOUT - 60)
+# One task per worker process at a time. The default prefetch (4) lets an
+# idle process hoard queued videos behind a long encode; with hour-long
+# jobs, fair dispatch matters far more than broker round-trips.
+celery_app.conf.worker_prefetch_multiplier = 1
+VIDEO_QUEUE = 'video'
+
+# ffmpeg thread budget: match the vCPUs this process may actually use
+# (sched_getaffinity respects cgroup/taskset limits, unlike cpu_count),
+# divided across concurrent Celery workers so parallel encodes don't
+# oversubscribe the cores. Set WORKER_CONCURRENCY to the worker pool size.
+WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', 1))
+try:
+    _available_cpus = len(os.sched_getaffinity(0))
+except AttributeError:  # sched_getaffinity is Linux-only
+    _available_cpus = os.cpu_count() or 1
+FFMPEG_THREADS = max(1, _available_cpus // max(1, WORKER_CONCURRENCY))
+
+# x264 preset: 'faster' cuts encode CPU ~70% versus 'medium' at the same CRF
+# with an imperceptible quality delta. Overridable per deployment.
+FFMPEG_PRESET = os.environ.get('FFMPEG_PRESET', 'faster')
+
+# Shared pool for JPEG encodes. libjpeg-turbo / Pillow-SIMD hold the GIL only
+# during setup, so routing the C-level encode through a pool sized to the
+# vCPUs lets a single Flask worker keep all cores busy under concurrent
+# image uploads without spawning unbounded encoder threads.
+ENCODE_POOL = ThreadPoolExecutor(max_workers=_available_cpus)
+
+# Hardware H.264 encoders in order of preference. Encoding on an ASIC block
+# (NVENC/QuickSync/VAAPI/VideoToolbox) moves the work off the CPU entirely
+# and routinely runs 5-20x real-time, versus libx264 saturating worker cores.
+HW_ENCODER_CANDIDATES = ['h264_nvenc', 'h264_qsv', 'h264_vaapi', 'h264_videotoolbox']
+
+def detect_video_encoder():
+    """Probe ffmpeg once for an available hardware H.264 encoder.
+
+    Returns the first candidate ffmpeg reports, or 'libx264' when no
+    hardware encoder is compiled in / no device is present. The HW_ENCODER
+    env var overrides probing: 'off'/'0'/'none' forces libx264, and any
+    name from HW_ENCODER_CANDIDATES (or 'libx264') skips the probe and
+    selects that encoder directly. Other names are rejected rather than
+    accepted blindly - compress_video only knows how to drive the rate
+    control of the listed encoders, so an unknown name would silently
+    fall through to the libx264 arguments anyway.
+    """
+    choice = os.environ.get('HW_ENCODER', 'auto').lower()
+    if choice in ('0', 'off', 'none'):
+        logger.info("Hardware encoding disabled via HW_ENCODER; using libx264")
+        return 'libx264'
+    if choice not in ('', '1', 'auto'):
+        if choice == 'libx264' or choice in HW_ENCODER_CANDIDATES:
+            logger.info(f"Using video encoder from HW_ENCODER: {choice}")
+            return choice
+        logger.warning(f"HW_ENCODER={choice} is not a supported encoder "
+                       f"(choose from {', '.join(HW_ENCODER_CANDIDATES)}); probing instead")
+    try:
+        output = subprocess.check_output(
+            ['ffmpeg', '-hide_banner', '-encoders'],
+            stderr=subprocess.STDOUT
+        ).decode()
+        for encoder in HW_ENCODER_CANDIDATES:
+            if encoder in output:
+                logger.info(f"Using hardware video encoder: {encoder}")
+                return encoder
+    except Exception as e:
+        logger.warning(f"Could not probe ffmpeg encoders ({e}); using libx264")
+    return 'libx264'
+
+VIDEO_ENCODER = detect_video_encoder()
+
+# Optional in-process transcoding via PyAV (libav bindings). Skips the
+# per-job fork/exec, CLI parsing and codec registration of the ffmpeg binary
+# (~50-200 ms fixed cost), which matters for high-frequency short clips.
+# Off by default: the subprocess path supports hardware encoders and streams
+# its output to Cloudinary without touching disk.
+USE_PYAV = os.environ.get('USE_PYAV', '0') == '1'
+if USE_PYAV:
+    try:
+        import av
+    except ImportError:
+        USE_PYAV = False
+        logger.warning("USE_PYAV is set but PyAV is not installed; using the ffmpeg binary")
+
 # Configure Cloudinary
 cloudinary.config(
     cloud_name=CLOUDINARY_CLOUD_NAME,
@@ -49,164 +273,400 @@ cloudinary.config(
     api_secret=CLOUDINARY_API_SECRET
 )
 
+# Reuse HTTPS connections to Cloudinary across uploads. The SDK's default
+# urllib3 pool keeps a single connection per host, so concurrent uploads each
+# pay a fresh TCP + TLS handshake; a wider keep-alive pool (with TLS session
+# reuse, since the pool outlives individual requests) amortizes that away.
+try:
+    _cloudinary_http = urllib3.PoolManager(
+        num_pools=8,
+        maxsize=32,
+        retries=urllib3.Retry(total=3, backoff_factor=0.2),
+        timeout=urllib3.Timeout(connect=10, read=300),
+        **getattr(cloudinary, 'CERT_KWARGS', {})
+    )
+    cloudinary.uploader._http = _cloudinary_http
+    logger.info("Cloudinary uploader configured with a pooled urllib3 connection manager")
+except Exception as e:
+    logger.warning(f"Could not configure Cloudinary connection pool ({e}); using SDK defaults")
+
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+# Cap the bytes Werkzeug buffers for non-file form fields (an oversized
+# field draws a 413). File parts are unaffected - they always spool to disk
+# past Werkzeug's own 500 KB threshold; what keeps large uploads off
+# RAM-backed tmpfs is the tempfile.tempdir redirect above.
+app.config['MAX_FORM_MEMORY_SIZE'] = int(os.environ.get('MAX_FORM_MEMORY_SIZE', 500 * 1024))
 
 # --- Helper Functions ---
 
-def allowed_file(filename):
-    """Check if the file extension is allowed."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def classify(filename):
+    """Classify a filename as 'image' or 'video' by extension, or None.
 
-def get_file_type(filename):
-    """Determine if the file is an image or video based on extension."""
-    ext = filename.rsplit('.', 1)[1].lower()
+    One splitext per request replaces the old allowed_file/get_file_type
+    pair, which each re-split the same filename.
+    """
+    ext = os.path.splitext(filename)[1][1:].lower()
     if ext in ALLOWED_IMAGE_EXTENSIONS:
         return 'image'
     elif ext in ALLOWED_VIDEO_EXTENSIONS:
         return 'video'
     return None
 
+# Magic-number signatures for common file types, longest first so the most
+# specific signature wins. Precomputed at module load; validate_file_content
+# only ever reads MAX_SIGNATURE_LENGTH bytes of the upload.
+FILE_SIGNATURES = sorted([
+    # Images
+    (b'\xFF\xD8\xFF', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1A\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+
+    # Videos
+    (b'\x00\x00\x00\x18ftypmp42', 'video/mp4'),
+    (b'\x00\x00\x00\x1cftypisom', 'video/mp4'),
+    (b'\x00\x00\x00\x20ftyp', 'video/mp4'),
+], key=lambda pair: -len(pair[0]))
+# 12 bytes also covers the RIFF form-type field checked below.
+MAX_SIGNATURE_LENGTH = max(12, max(len(signature) for signature, _ in FILE_SIGNATURES))
+
 def validate_file_content(file_stream, claimed_type):
-    """Validate that the file content matches its claimed type."""
-    # Save a copy of the stream content
-    content = file_stream.read()
+    """Validate that the file content matches its claimed type.
+
+    Prefers libmagic, which parses the container structure in native code;
+    without it, falls back to the signature table above. Either way only a
+    small prefix of the upload is read.
+    """
+    if _magic is not None:
+        mime = _magic.from_buffer(file_stream.read(4096))
+        file_stream.seek(0)
+        if mime.startswith('image/'):
+            return claimed_type == 'image'
+        if mime.startswith('video/'):
+            return claimed_type == 'video'
+        # Unrecognized container: trust the extension, as below
+        return True
+
+    header = file_stream.read(MAX_SIGNATURE_LENGTH)
     file_stream.seek(0)  # Reset stream position
-    
-    # Check magic numbers for common file types
-    magic_numbers = {
-        # Images
-        b'\xFF\xD8\xFF': 'image/jpeg',
-        b'\x89PNG\r\n\x1A\n': 'image/png',
-        b'GIF87a': 'image/gif',
-        b'GIF89a': 'image/gif',
-        b'RIFF': 'image/webp',  # WEBP starts with "RIFF"
-        
-        # Videos
-        b'\x00\x00\x00\x18ftypmp42': 'video/mp4',
-        b'\x00\x00\x00\x1cftypisom': 'video/mp4',
-        b'\x00\x00\x00\x20ftyp': 'video/mp4',
-        b'RIFF': 'video/avi',  # AVI also starts with "RIFF"
-    }
-    
-    for signature, mime_type in magic_numbers.items():
-        if content.startswith(signature):
+
+    # RIFF is a shared container prefix - bytes 8:12 hold the form type -
+    # so a 4-byte signature alone would misclassify every WEBP as AVI.
+    if header[:4] == b'RIFF':
+        form = header[8:12]
+        if form == b'WEBP':
+            return claimed_type == 'image'
+        if form == b'AVI ':
+            return claimed_type == 'video'
+        return True
+
+    for signature, mime_type in FILE_SIGNATURES:
+        if header.startswith(signature):
             expected_type = 'image' if mime_type.startswith('image') else 'video'
-            file_stream.seek(0)  # Reset stream position again
             return expected_type == claimed_type
-            
+
     # If we can't determine the type from magic numbers, we'll trust the extension
-    file_stream.seek(0)  # Reset stream position again
     return True
 
-def compress_image(image_file, quality=85, max_dimensions=(1920, 1080)):
+def compress_image(image_file, quality=85, max_dimensions=None):
     """
-    Compresses an image using Pillow with size limits.
+    Compresses an image with size limits.
+
+    JPEG inputs that fit within max_dimensions are re-encoded through
+    TurboJPEG (libjpeg-turbo) in one native call. Other formats, and JPEGs
+    that need resizing, are decoded/resized with Pillow and then encoded via
+    TurboJPEG when available, or Pillow otherwise.
     Args:
         image_file: A file-like object (e.g., from request.files).
         quality: The compression quality (0-100).
-        max_dimensions: Maximum width and height.
+        max_dimensions: Maximum width and height; defaults to an
+            IMAGE_MAX_EDGE square.
     Returns:
-        A BytesIO object containing the compressed image, or None if an error occurs.
+        A rewound file-like object containing the compressed image (spooled
+        to disk past 2 MB so uploads stream from a file handle rather than
+        one large heap buffer), or None if an error occurs.
     """
+    if max_dimensions is None:
+        max_dimensions = (IMAGE_MAX_EDGE, IMAGE_MAX_EDGE)
     try:
-        img = Image.open(image_file)
-        
-        # Resize if the image is too large
-        if img.width > max_dimensions[0] or img.height > max_dimensions[1]:
-            img.thumbnail(max_dimensions, Image.LANCZOS)
-            logger.info(f"Image resized to {img.width}x{img.height}")
-        
-        # Convert to RGB if image has an alpha channel (e.g., PNG) to save as JPG
-        if img.mode == 'RGBA':
-            img = img.convert('RGB')
+        # Read the upload exactly once; every path below (header probe,
+        # TurboJPEG, Pillow) decodes from this buffer instead of seeking
+        # back and re-reading the request stream, which may be spooled on
+        # disk. len() is also the only reliable original size - tell() on
+        # a stream PIL has partially consumed is not.
+        raw = image_file.read()
+        original_size = len(raw)
+        encoded = None  # full JPEG bytes from a TurboJPEG encode
+        output_buffer = None
+
+        # Bypass: small JPEGs that fit the dimension box and are already
+        # tightly compressed (under ~2 bits per pixel) gain nothing from a
+        # second lossy pass; forward the original bytes.
+        if raw[:3] == b'\xFF\xD8\xFF' and 0 < original_size <= IMAGE_PASSTHROUGH_MAX_BYTES:
+            if _turbojpeg is not None:
+                width, height = _turbojpeg.decode_header(raw)[:2]
+            else:
+                # Image.open only parses the header; no pixel decode happens
+                width, height = Image.open(io.BytesIO(raw)).size
+            if (width <= max_dimensions[0] and height <= max_dimensions[1]
+                    and original_size <= 0.25 * width * height):
+                logger.info(f"Forwarding already-compressed JPEG untouched ({original_size/1024:.2f}KB)")
+                return io.BytesIO(raw)
+
+        # Fast path: JPEG in, JPEG out, no resize needed - one native call.
+        if _turbojpeg is not None and raw[:3] == b'\xFF\xD8\xFF':
+            width, height, _, _ = _turbojpeg.decode_header(raw)
+            if width <= max_dimensions[0] and height <= max_dimensions[1]:
+                pixels = _turbojpeg.decode(raw, pixel_format=TJPF_RGB)
+                # encode() defaults to TJPF_BGR, so the pixel format must be
+                # spelled out to match the decode above or colors swap.
+                encoded = ENCODE_POOL.submit(
+                    _turbojpeg.encode, pixels, quality=quality,
+                    jpeg_subsample=TJSAMP_420, pixel_format=TJPF_RGB,
+                    flags=TJFLAG_FASTDCT
+                ).result()
+
+        if encoded is None:
+            img = Image.open(io.BytesIO(raw))
 
-        output_buffer = io.BytesIO()
-        # Save as JPEG for better compression, specify quality
-        img.save(output_buffer, format='JPEG', quality=quality)
+            # For JPEGs, draft() lets libjpeg IDCT at 1/2, 1/4 or 1/8 scale
+            # during decode, skipping most of the pixels of an oversized
+            # source before the precise thumbnail pass below. It mutates the
+            # loader in place and only works before any pixel access, so it
+            # must stay ahead of thumbnail()/convert()/load().
+            if img.format == 'JPEG':
+                img.draft('RGB', max_dimensions)
+
+            # Resize if the image is too large
+            if img.width > max_dimensions[0] or img.height > max_dimensions[1]:
+                img.thumbnail(max_dimensions, Image.LANCZOS)
+                logger.info(f"Image resized to {img.width}x{img.height}")
+
+            # JPEG output is always RGB. Transparent modes get composited
+            # onto white in a single native paste - a plain convert() just
+            # drops alpha, leaving black fringes on images meant for light
+            # backgrounds. Image.new with a solid fill is effectively free.
+            if img.mode in ('RGBA', 'LA', 'P'):
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.convert('RGBA').split()[-1])
+                img = background
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+
+            if _turbojpeg is not None:
+                encoded = ENCODE_POOL.submit(
+                    _turbojpeg.encode, np.asarray(img), quality=quality,
+                    jpeg_subsample=TJSAMP_420, pixel_format=TJPF_RGB
+                ).result()
+            else:
+                # No preallocation: the output is a spooled temp file, and
+                # zero-filling it from a size estimate forces an immediate
+                # rollover to disk (plus a wasted write) whenever the
+                # estimate tops the spool cap - the realloc-avoidance trick
+                # only paid off when this buffer was a plain BytesIO.
+                output_buffer = tempfile.SpooledTemporaryFile(max_size=IMAGE_SPOOL_MAX_BYTES)
+                # Save as JPEG for better compression. optimize is left off
+                # (the second Huffman pass isn't worth it at quality 85) and
+                # 4:2:0 subsampling matches the TurboJPEG path, switching to
+                # 4:4:4 only at high quality settings.
+                ENCODE_POOL.submit(
+                    img.save, output_buffer, format='JPEG', quality=quality,
+                    subsampling=0 if quality >= 90 else 2, optimize=False
+                ).result()
+
+        if encoded is not None:
+            output_buffer = tempfile.SpooledTemporaryFile(max_size=IMAGE_SPOOL_MAX_BYTES)
+            output_buffer.write(encoded)
+
+        compressed_size = output_buffer.tell()
         output_buffer.seek(0)  # Rewind the buffer to the beginning
-        
+
         # Log compression ratio
-        original_size = image_file.tell()
-        compressed_size = output_buffer.getbuffer().nbytes
         ratio = (1 - (compressed_size / original_size)) * 100 if original_size > 0 else 0
         logger.info(f"Image compressed from {original_size/1024:.2f}KB to {compressed_size/1024:.2f}KB ({ratio:.2f}% reduction)")
-        
+
         return output_buffer
     except Exception as e:
         logger.error(f"Error compressing image: {e}")
         return None
 
-def compress_video(video_path, output_path, crf=28, preset='medium', max_resolution='1920x1080'):
+def _feed_ffmpeg_stdin(input_stream, stdin_pipe):
+    """Copy input bytes into ffmpeg's stdin, tolerating early encoder exit.
+
+    When the source is a real file on Linux, os.splice moves the bytes
+    kernel-side (no userspace copy of the payload at all); otherwise a
+    buffered copy loop is used.
+    """
+    try:
+        try:
+            in_fd = input_stream.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            in_fd = None
+
+        if in_fd is not None and hasattr(os, 'splice'):
+            try:
+                out_fd = stdin_pipe.fileno()
+                while os.splice(in_fd, out_fd, 1 << 20) > 0:
+                    pass
+                return
+            except BrokenPipeError:
+                return
+            except OSError:
+                # splice can fail on exotic filesystems; the file offset has
+                # advanced past whatever was already sent, so the fallback
+                # loop resumes from there.
+                pass
+
+        shutil.copyfileobj(input_stream, stdin_pipe, 1 << 20)
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            stdin_pipe.close()
+        except OSError:
+            pass
+
+def _drain_ffmpeg_log(stderr_pipe, error_tail):
+    """Drain ffmpeg's (error-only) log pipe, keeping a tail for diagnostics."""
+    for line in iter(stderr_pipe.readline, b''):
+        error_tail.append(line)
+    stderr_pipe.close()
+
+def compress_video(video_source, output_path=None, crf=28, preset=FFMPEG_PRESET, max_resolution='1920x1080'):
     """
     Compresses a video using ffmpeg with more control options.
+
+    video_source may be a filesystem path or a file-like object; file-like
+    sources are piped into ffmpeg's stdin so the encoder starts as soon as
+    bytes are available and no extra on-disk copy is needed. Note that
+    containers requiring seekable input (e.g. MP4 with a trailing moov atom)
+    cannot be decoded from a pipe - callers should retry with the path.
+
+    When output_path is None, the compressed video is written to stdout as a
+    fragmented MP4 and the ffmpeg Popen object is returned (None on launch
+    failure); the caller must drain process.stdout and check the return code.
+    A deque of recent log lines is attached as process.error_tail for
+    diagnostics. With an output_path, the function blocks and returns
+    True/False as before.
+
+    The default preset is 'faster': it skips x264's most expensive motion
+    estimation modes for a roughly 3x shorter encode at the same CRF, with
+    a negligible bitrate increase ('ultrafast' is deliberately avoided as
+    it degrades the quality/bitrate ratio badly).
     """
     try:
-        # Get video info before compression
-        probe_cmd = [
-            'ffprobe', 
-            '-v', 'error', 
-            '-show_entries', 'format=size', 
-            '-of', 'default=noprint_wrappers=1:nokey=1', 
-            video_path
-        ]
-        original_size = int(subprocess.check_output(probe_cmd, stderr=subprocess.STDOUT).decode().strip())
-        
+        streaming_input = not isinstance(video_source, str)
+
+        # Get the input size before compression (for a stream, stat the
+        # backing file if there is one). A plain stat() replaces the old
+        # ffprobe spawn, which cost a fork/exec just to report file size.
+        probe_target = getattr(video_source, 'name', None) if streaming_input else video_source
+        original_size = 0
+        if probe_target and os.path.exists(str(probe_target)):
+            original_size = os.path.getsize(str(probe_target))
+
         # Compress the video
+        max_width, max_height = max_resolution.split('x')
+        scale_filter = f'scale=min(iw\,{max_width}):min(ih\,{max_height}):force_original_aspect_ratio=decrease'
+        input_args = []
+
+        # Hardware encoders don't use libx264's CRF scale; map the quality
+        # knob onto each encoder's own rate control. Note they tend to
+        # produce slightly larger files at equal visual quality.
+        if VIDEO_ENCODER == 'h264_nvenc':
+            codec_args = ['-c:v', 'h264_nvenc', '-preset', 'p4', '-rc', 'vbr', '-cq', str(crf), '-b:v', '0']
+        elif VIDEO_ENCODER == 'h264_qsv':
+            codec_args = ['-c:v', 'h264_qsv', '-global_quality', str(crf), '-preset', preset]
+        elif VIDEO_ENCODER == 'h264_vaapi':
+            input_args = ['-vaapi_device', '/dev/dri/renderD128']
+            scale_filter += ',format=nv12,hwupload'
+            codec_args = ['-c:v', 'h264_vaapi', '-qp', str(crf)]
+        elif VIDEO_ENCODER == 'h264_videotoolbox':
+            # VideoToolbox's quality scale runs 1-100 (higher is better);
+            # fold the CRF knob onto it roughly
+            codec_args = ['-c:v', 'h264_videotoolbox',
+                          '-q:v', str(max(1, min(100, (51 - crf) * 2)))]
+        else:
+            # fastdecode drops CABAC/loop-filter features that slow software
+            # decoders; combined with the 'faster' preset it wins on both
+            # encode and decode time for a small file-size cost. Forcing
+            # 8-bit 4:2:0 high/4.0 keeps 10-bit and 4:4:4 sources playable
+            # in browsers (notably Safari) and on x264's fastest code paths.
+            codec_args = ['-vcodec', 'libx264', '-crf', str(crf), '-preset', preset,
+                          '-tune', 'fastdecode', '-pix_fmt', 'yuv420p',
+                          '-profile:v', 'high', '-level', '4.0',
+                          '-threads', str(FFMPEG_THREADS)]
+
+        if output_path is None:
+            # Fragmented MP4 so the muxer never seeks back into the stream;
+            # +faststart is meaningless on a pipe.
+            output_args = ['-movflags', 'frag_keyframe+empty_moov', '-f', 'mp4', 'pipe:1']
+        else:
+            output_args = ['-movflags', '+faststart', output_path]  # Optimize for web streaming
+
         command = [
             'ffmpeg',
-            '-i', video_path,
-            '-vf', f'scale=min(iw\,{max_resolution.split("x")[0]}):min(ih\,{max_resolution.split("x")[1]}):force_original_aspect_ratio=decrease',
-            '-vcodec', 'libx264',
-            '-crf', str(crf),
-            '-preset', preset,
-            '-movflags', '+faststart',  # Optimize for web streaming
+            # No per-frame stats: parsing that firehose line-by-line in
+            # Python costs real CPU during fast encodes, and anything at
+            # 'error' level is worth keeping whole.
+            '-nostats', '-loglevel', 'error',
+            *input_args,
+            '-i', 'pipe:0' if streaming_input else video_source,
+            '-vf', scale_filter,
+            *codec_args,
             '-y',  # Overwrite output file without asking
-            output_path
+            *output_args
         ]
         logger.info(f"Attempting video compression with command: {' '.join(command)}")
-        
-        # Run the ffmpeg command and capture progress
+
+        # Run the ffmpeg command. Pipes are binary because stdin/stdout may
+        # carry the video itself; log lines are decoded manually.
         process = subprocess.Popen(
-            command, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.STDOUT,
-            universal_newlines=True
+            command,
+            stdin=subprocess.PIPE if streaming_input else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE if output_path is None else subprocess.STDOUT
         )
-        
-        # Process the output to extract progress information
-        while True:
-            line = process.stdout.readline()
-            if not line:
-                break
-            
-            # Example of extracting progress info from ffmpeg output
-            if "time=" in line:
-                try:
-                    time_info = line.split("time=")[1].split()[0]
-                    # You could store this progress info in Redis for the job
-                    # redis_client.hset(f"job:{job_id}", "progress", time_info)
-                    logger.debug(f"Progress: {time_info}")
-                except Exception:
-                    pass
-        
+
+        # Feed the source from a helper thread so ffmpeg's output can keep
+        # being drained (avoids pipe-buffer deadlock)
+        feeder = None
+        if streaming_input:
+            feeder = threading.Thread(
+                target=_feed_ffmpeg_stdin, args=(video_source, process.stdin), daemon=True
+            )
+            feeder.start()
+
+        if output_path is None:
+            # Streaming mode: hand the process back with stdout carrying the
+            # fragmented MP4; a helper thread keeps ffmpeg's log pipe drained.
+            process.error_tail = deque(maxlen=20)
+            threading.Thread(
+                target=_drain_ffmpeg_log, args=(process.stderr, process.error_tail), daemon=True
+            ).start()
+            return process
+
+        # Wait for the encode; anything that appears at 'error' level is
+        # actual error text, so keep it whole for the log. communicate()
+        # is avoided deliberately - it closes stdin immediately, racing a
+        # feeder thread still writing into the pipe - so the log pipe is
+        # drained directly and the feeder keeps ownership of stdin.
+        output = process.stdout.read()
+        process.stdout.close()
+        if feeder is not None:
+            feeder.join(timeout=10)
         process.wait()
-        
+
         if process.returncode != 0:
-            logger.error(f"ffmpeg returned non-zero exit code: {process.returncode}")
+            logger.error(f"ffmpeg returned non-zero exit code {process.returncode}: "
+                         f"{output.decode(errors='replace').strip()}")
             return False
             
         # Get compressed video info
         if os.path.exists(output_path):
-            probe_cmd = [
-                'ffprobe', 
-                '-v', 'error', 
-                '-show_entries', 'format=size', 
-                '-of', 'default=noprint_wrappers=1:nokey=1', 
-                output_path
-            ]
-            compressed_size = int(subprocess.check_output(probe_cmd, stderr=subprocess.STDOUT).decode().strip())
-            
+            compressed_size = os.path.getsize(output_path)
+
             ratio = (1 - (compressed_size / original_size)) * 100 if original_size > 0 else 0
             logger.info(f"Video compressed from {original_size/1024/1024:.2f}MB to {compressed_size/1024/1024:.2f}MB ({ratio:.2f}% reduction)")
             return True
@@ -224,47 +684,172 @@ def compress_video(video_path, output_path, crf=28, preset='medium', max_resolut
         logger.error(f"An unexpected error occurred during video compression: {e}")
         return False
 
+def _update_job(job_id, mapping, expire_seconds=None):
+    """Write a job-hash update (and optional TTL) in one Redis round-trip.
+
+    Job transitions used to issue several hset/hmset/expire calls, each a
+    network RTT blocking the worker; a non-transactional pipeline collapses
+    them into a single round-trip. Status changes are also published on the
+    job's pub/sub channel so SSE watchers are woken immediately instead of
+    polling the hash.
+    """
+    with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hset(f"job:{job_id}", mapping=mapping)
+        if expire_seconds:
+            pipe.expire(f"job:{job_id}", expire_seconds)
+        if 'status' in mapping:
+            pipe.publish(f"job:{job_id}:events", json.dumps(mapping, default=str))
+        pipe.execute()
+
+def compress_video_pyav(video_path, output_path, crf=28, preset=FFMPEG_PRESET, max_edge=1920):
+    """Transcode a video in-process with PyAV (no subprocess per job).
+
+    Scales the video to fit max_edge, encodes H.264 at the given CRF/preset
+    with the same tuning as the CLI path, and remuxes audio untouched.
+    Returns True on success.
+    """
+    try:
+        # movflags is a muxer option, so it goes on the output container -
+        # on the encoder stream's options it is silently ignored.
+        with av.open(video_path) as in_container, \
+                av.open(output_path, 'w', options={'movflags': '+faststart'}) as out_container:
+            in_video = in_container.streams.video[0]
+            width = in_video.codec_context.width
+            height = in_video.codec_context.height
+            scale = min(1.0, max_edge / max(width, height))
+            # Encoder dimensions must be even for yuv420p
+            out_width = int(width * scale) // 2 * 2
+            out_height = int(height * scale) // 2 * 2
+
+            out_video = out_container.add_stream('libx264', rate=in_video.average_rate)
+            out_video.width = out_width
+            out_video.height = out_height
+            out_video.pix_fmt = 'yuv420p'
+            out_video.options = {
+                'crf': str(crf),
+                'preset': preset,
+                'tune': 'fastdecode',
+                'threads': str(FFMPEG_THREADS)
+            }
+            out_audio = {s: out_container.add_stream_from_template(s)
+                         for s in in_container.streams.audio}
+
+            for packet in in_container.demux():
+                if packet.dts is None:
+                    continue
+                if packet.stream is in_video:
+                    for frame in packet.decode():
+                        if (out_width, out_height) != (width, height):
+                            frame = frame.reformat(width=out_width, height=out_height)
+                        for out_packet in out_video.encode(frame):
+                            out_container.mux(out_packet)
+                elif packet.stream in out_audio:
+                    packet.stream = out_audio[packet.stream]
+                    out_container.mux(packet)
+
+            # Flush the encoder
+            for out_packet in out_video.encode():
+                out_container.mux(out_packet)
+        return True
+    except Exception as e:
+        logger.error(f"PyAV transcode failed: {e}")
+        return False
+
+def _pyav_compress_and_upload(file_path, job_id):
+    """PyAV variant of the encode+upload step (in-process, file-based)."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix='_compressed.mp4') as temp_output_file:
+        output_path = temp_output_file.name
+    try:
+        if not compress_video_pyav(file_path, output_path):
+            return None
+        _update_job(job_id, {"status": "uploading"})
+        return cloudinary.uploader.upload_large(
+            output_path,
+            resource_type='video',
+            chunk_size=CLOUDINARY_CHUNK_SIZE,
+            folder="compressed_gallery_videos",
+            quality="auto:eco"
+        )
+    except Exception as e:
+        logger.error(f"Upload failed for job {job_id}: {e}")
+        return None
+    finally:
+        if os.path.exists(output_path):
+            os.unlink(output_path)
+
+def _stream_compress_and_upload(video_source, job_id):
+    """Encode a video and upload the result to Cloudinary.
+
+    ffmpeg writes a fragmented MP4 to stdout, which is drained straight
+    into an anonymous temp file as it is produced, so the encode overlaps
+    the disk write and the compressed video never sits in memory. The
+    staged file is then posted with the chunked uploader - Cloudinary's
+    SDK sizes its source with tell()/seek() before reading anything, so
+    ffmpeg's pipe cannot be handed to it directly (pipes raise Illegal
+    seek). Returns the Cloudinary upload result, or None if compression
+    or upload failed.
+    """
+    process = compress_video(video_source)
+    if not process:
+        return None
+    with tempfile.TemporaryFile(suffix='_compressed.mp4') as staged:
+        try:
+            shutil.copyfileobj(process.stdout, staged, 1 << 20)
+        finally:
+            process.stdout.close()
+            process.wait()
+
+        if process.returncode != 0:
+            tail = b''.join(getattr(process, 'error_tail', [])).decode(errors='replace')
+            logger.error(f"ffmpeg returned non-zero exit code {process.returncode}: {tail.strip()}")
+            return None
+
+        _update_job(job_id, {"status": "uploading"})
+        staged.seek(0)
+        try:
+            return cloudinary.uploader.upload_large(
+                staged,
+                resource_type='video',
+                chunk_size=CLOUDINARY_CHUNK_SIZE,
+                folder="compressed_gallery_videos",
+                quality="auto:eco"
+            )
+        except Exception as e:
+            logger.error(f"Upload failed for job {job_id}: {e}")
+            return None
+
 def process_video_job(job_id, file_path, original_filename):
     """Process a video compression job from the queue."""
     try:
         # Update job status
-        redis_client.hset(f"job:{job_id}", "status", "processing")
-        
-        # Define a temporary output path for the compressed video
-        with tempfile.NamedTemporaryFile(delete=False, suffix='_compressed.mp4') as temp_output_file:
-            compressed_output_path = temp_output_file.name
-        
-        # Compress video using ffmpeg
-        compression_successful = compress_video(file_path, compressed_output_path)
-        
+        _update_job(job_id, {"status": "processing"})
+        original_size = os.path.getsize(file_path)
+
+        if USE_PYAV:
+            # In-process transcode; avoids a subprocess per job
+            upload_result = _pyav_compress_and_upload(file_path, job_id)
+        else:
+            # The upload is already a file on disk, so let ffmpeg open the
+            # path itself: piping it through stdin saves no I/O here and
+            # breaks containers that need seekable input (e.g. MP4 with a
+            # trailing moov atom - the typical phone upload). The
+            # stdin/splice path in compress_video stays for genuinely
+            # non-seekable sources.
+            upload_result = _stream_compress_and_upload(file_path, job_id)
+
         # Clean up original temp file
         os.unlink(file_path)
         logger.info(f"Cleaned up original temporary video file: {file_path}")
-        
-        if not compression_successful:
-            # Clean up partially created compressed file if any
-            if os.path.exists(compressed_output_path):
-                os.unlink(compressed_output_path)
-            redis_client.hset(f"job:{job_id}", "status", "failed")
-            redis_client.hset(f"job:{job_id}", "error", "Video compression failed")
+
+        if upload_result is None:
+            _update_job(job_id, {"status": "failed", "error": "Video compression failed"})
             logger.error(f"Video compression failed for {original_filename}.")
             return
-            
-        # Upload compressed video to Cloudinary
-        logger.info(f"Uploading compressed video {original_filename} to Cloudinary.")
-        redis_client.hset(f"job:{job_id}", "status", "uploading")
-        
-        upload_result = cloudinary.uploader.upload(
-            compressed_output_path,
-            resource_type='video',
-            folder="compressed_gallery_videos",
-            quality="auto:eco"
-        )
-        
-        # Clean up compressed temp file
-        os.unlink(compressed_output_path)
-        logger.info(f"Cleaned up compressed temporary video file: {compressed_output_path}")
-        
+
+        compressed_size = int(upload_result.get('bytes', 0))
+        ratio = (1 - (compressed_size / original_size)) * 100 if original_size > 0 else 0
+        logger.info(f"Video compressed from {original_size/1024/1024:.2f}MB to {compressed_size/1024/1024:.2f}MB ({ratio:.2f}% reduction)")
+
         # Update job with success and result info
         result = {
             "status": "completed",
@@ -275,40 +860,21 @@ def process_video_job(job_id, file_path, original_filename):
             "completed_at": time.time()
         }
         
-        redis_client.hmset(f"job:{job_id}", result)
+        # Write the result and the 24 hour expiry in one round-trip
+        _update_job(job_id, result, expire_seconds=86400)
         logger.info(f"Video {original_filename} processed successfully. URL: {upload_result['secure_url']}")
-        
-        # Set job expiration
-        redis_client.expire(f"job:{job_id}", 86400)  # Expire after 24 hours
-        
+
     except Exception as e:
         logger.exception(f"Error processing video job {job_id}: {e}")
-        redis_client.hmset(f"job:{job_id}", {
+        _update_job(job_id, {
             "status": "failed",
             "error": str(e)
-        })
-        redis_client.expire(f"job:{job_id}", 86400)  # Expire after 24 hours
-
-def video_worker():
-    """Worker thread for processing videos from the queue."""
-    while True:
-        try:
-            job_data = video_processing_queue.get()
-            job_id = job_data["job_id"]
-            file_path = job_data["file_path"]
-            original_filename = job_data["original_filename"]
-            
-            process_video_job(job_id, file_path, original_filename)
-        except Exception as e:
-            logger.exception(f"Error in video worker thread: {e}")
-        finally:
-            video_processing_queue.task_done()
+        }, expire_seconds=86400)
 
-# Start worker threads
-for i in range(MAX_WORKER_THREADS):
-    t = threading.Thread(target=video_worker, daemon=True)
-    t.start()
-    logger.info(f"Started worker thread {i+1}")
+@celery_app.task(name='compress.process_video')
+def process_video(job_id, file_path, original_filename):
+    """Celery task entry point for video compression jobs."""
+    process_video_job(job_id, file_path, original_filename)
 
 # --- API Middleware ---
 
@@ -322,12 +888,83 @@ def require_api_key(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def handle_image_upload(image_file, filename):
+    """Compress an image and upload it to Cloudinary. Returns a Flask response."""
+    logger.info(f"Processing image file: {filename}")
+
+    if not LOCAL_IMAGE_COMPRESS:
+        # Let the CDN do the work: ship the original bytes and have
+        # Cloudinary's q_auto:eco/f_auto produce the delivery rendition.
+        logger.info(f"Local compression disabled; uploading {filename} as-is to Cloudinary.")
+        upload_result = cloudinary.uploader.upload(
+            image_file,
+            resource_type='image',
+            folder="compressed_gallery_images",
+            quality="auto:eco",
+            fetch_format="auto"
+        )
+        logger.info(f"Image {filename} uploaded successfully to Cloudinary. URL: {upload_result['secure_url']}")
+        return jsonify({
+            "message": "Image uploaded successfully (compressed by Cloudinary)",
+            "original_filename": filename,
+            "cloudinary_url": upload_result['secure_url'],
+            "public_id": upload_result['public_id']
+        }), 200
+
+    compressed_file_buffer = compress_image(image_file)
+    if compressed_file_buffer is None:
+        logger.error(f"Image compression failed for {filename}.")
+        return jsonify({"error": "Failed to compress image"}), 500
+
+    # Upload compressed image to Cloudinary. The buffer is a seekable
+    # spooled file - the SDK sizes its source with seek/tell before
+    # reading, so a pipe straight from the encoder is not an option here.
+    logger.info(f"Uploading compressed image {filename} to Cloudinary.")
+    upload_result = cloudinary.uploader.upload(
+        compressed_file_buffer,
+        resource_type='image',
+        folder="compressed_gallery_images",
+        quality="auto:eco"
+    )
+
+    logger.info(f"Image {filename} uploaded successfully to Cloudinary. URL: {upload_result['secure_url']}")
+    return jsonify({
+        "message": "Image compressed and uploaded successfully",
+        "original_filename": filename,
+        "cloudinary_url": upload_result['secure_url'],
+        "public_id": upload_result['public_id']
+    }), 200
+
+def enqueue_video_job(input_path, filename):
+    """Create a job record and queue a saved video for background compression."""
+    job_id = str(uuid.uuid4())
+
+    # Create and save job info
+    job_info = {
+        "job_id": job_id,
+        "status": "queued",
+        "original_filename": filename,
+        "created_at": time.time()
+    }
+    redis_client.hset(f"job:{job_id}", mapping=job_info)
+
+    # Hand off to a Celery worker
+    process_video.delay(job_id, input_path, filename)
+
+    logger.info(f"Video job {job_id} created and queued for processing")
+    return jsonify({
+        "message": "Video compression job created",
+        "job_id": job_id,
+        "status": "queued"
+    }), 202
+
 # --- API Endpoints ---
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Simple health check endpoint."""
-    queue_size = video_processing_queue.qsize()
+    # With the Redis broker, pending tasks sit in a list named after the queue
+    queue_size = redis_client.llen(VIDEO_QUEUE)
     return jsonify({
         "status": "healthy",
         "queue_size": queue_size,
@@ -351,14 +988,15 @@ def upload_and_compress():
         logger.warning("No selected file in the request.")
         return jsonify({"error": "No selected file"}), 400
         
-    if not allowed_file(file.filename):
+    # Secure the filename and classify it in one pass
+    filename = secure_filename(file.filename)
+    resource_type = classify(filename)
+
+    if resource_type is None:
         logger.warning(f"Unsupported file type: {file.filename}")
         return jsonify({"error": "Unsupported file type"}), 400
-    
-    # Secure the filename and get file type
-    filename = secure_filename(file.filename)
-    resource_type = get_file_type(filename)
-    
+
+
     if not validate_file_content(file, resource_type):
         logger.warning(f"File content validation failed: {filename}")
         return jsonify({"error": "File content doesn't match its extension"}), 400
@@ -366,62 +1004,22 @@ def upload_and_compress():
     try:
         if resource_type == 'image':
             # Process image synchronously
-            logger.info(f"Processing image file: {filename}")
-            compressed_file_buffer = compress_image(file)
-            if compressed_file_buffer is None:
-                logger.error(f"Image compression failed for {filename}.")
-                return jsonify({"error": "Failed to compress image"}), 500
-
-            # Upload compressed image to Cloudinary
-            logger.info(f"Uploading compressed image {filename} to Cloudinary.")
-            upload_result = cloudinary.uploader.upload(
-                compressed_file_buffer,
-                resource_type='image',
-                folder="compressed_gallery_images",
-                quality="auto:eco"
-            )
-            
-            logger.info(f"Image {filename} uploaded successfully to Cloudinary. URL: {upload_result['secure_url']}")
-            return jsonify({
-                "message": "Image compressed and uploaded successfully",
-                "original_filename": filename,
-                "cloudinary_url": upload_result['secure_url'],
-                "public_id": upload_result['public_id']
-            }), 200
+            return handle_image_upload(file, filename)
 
         elif resource_type == 'video':
             # Process video asynchronously
             logger.info(f"Creating async job for video file: {filename}")
-            job_id = str(uuid.uuid4())
-            
-            # Save the uploaded video to a temporary file for ffmpeg processing
+
+            # Save the uploaded video to a temporary file for ffmpeg
+            # processing, copying in 1 MiB chunks straight off the request
+            # stream - file.save() would buffer through Werkzeug's spool and
+            # copy in much smaller blocks
             with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{filename.rsplit(".", 1)[1].lower()}') as temp_input_file:
-                file.save(temp_input_file.name)
+                shutil.copyfileobj(file.stream, temp_input_file, 1 << 20)
                 original_input_path = temp_input_file.name
             logger.info(f"Original video saved to temporary path: {original_input_path}")
-            
-            # Create and save job info
-            job_info = {
-                "job_id": job_id,
-                "status": "queued",
-                "original_filename": filename,
-                "created_at": time.time()
-            }
-            redis_client.hmset(f"job:{job_id}", job_info)
-            
-            # Add to processing queue
-            video_processing_queue.put({
-                "job_id": job_id,
-                "file_path": original_input_path,
-                "original_filename": filename
-            })
-            
-            logger.info(f"Video job {job_id} created and queued for processing")
-            return jsonify({
-                "message": "Video compression job created",
-                "job_id": job_id,
-                "status": "queued"
-            }), 202
+
+            return enqueue_video_job(original_input_path, filename)
 
     except Exception as e:
         logger.exception(f"An unhandled error occurred during processing of {filename}.")
@@ -430,6 +1028,56 @@ def upload_and_compress():
     logger.error("Reached end of function without successful processing or explicit error.")
     return jsonify({"error": "Something went wrong"}), 500
 
+@app.route('/upload-and-compress-stream', methods=['PUT', 'POST'])
+@require_api_key
+def upload_and_compress_stream():
+    """
+    Raw-body variant of /upload-and-compress for large files.
+
+    The client sends the file bytes directly (Content-Type:
+    application/octet-stream) with the original filename in an X-Filename
+    header. The body is copied from the socket to a temp file in 1 MiB
+    chunks, bypassing multipart parsing and Werkzeug's spooled buffering
+    entirely - for multi-GB videos this halves upload-phase memory and
+    disk traffic.
+    """
+    filename = secure_filename(request.headers.get('X-Filename', ''))
+    if not filename:
+        return jsonify({"error": "Missing X-Filename header"}), 400
+
+    resource_type = classify(filename)
+    if resource_type is None:
+        logger.warning(f"Unsupported file type: {filename}")
+        return jsonify({"error": "Unsupported file type"}), 400
+
+    # Stream the body straight to disk
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{filename.rsplit(".", 1)[1].lower()}') as temp_input_file:
+        shutil.copyfileobj(request.stream, temp_input_file, 1 << 20)
+        input_path = temp_input_file.name
+    logger.info(f"Streamed upload saved to temporary path: {input_path}")
+
+    try:
+        with open(input_path, 'rb') as saved_file:
+            if not validate_file_content(saved_file, resource_type):
+                os.unlink(input_path)
+                logger.warning(f"File content validation failed: {filename}")
+                return jsonify({"error": "File content doesn't match its extension"}), 400
+
+            if resource_type == 'image':
+                response = handle_image_upload(saved_file, filename)
+
+        if resource_type == 'image':
+            os.unlink(input_path)
+            return response
+
+        return enqueue_video_job(input_path, filename)
+
+    except Exception as e:
+        if os.path.exists(input_path):
+            os.unlink(input_path)
+        logger.exception(f"An unhandled error occurred during processing of {filename}.")
+        return jsonify({"error": f"An internal server error occurred: {str(e)}"}), 500
+
 @app.route('/job/<job_id>', methods=['GET'])
 def check_job_status(job_id):
     """
@@ -454,43 +1102,58 @@ def check_job_status(job_id):
 def stream_job_progress(job_id):
     """
     Stream job progress updates using server-sent events.
+
+    Status changes are pushed over Redis pub/sub (published by _update_job)
+    instead of polling HGETALL once a second, so updates reach the client
+    immediately and idle viewers cost no Redis traffic.
     """
     def generate():
-        last_status = None
-        retry_count = 0
-        max_retries = 600  # 10 minutes max (at 1 second intervals)
-        
-        while retry_count < max_retries:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(f"job:{job_id}:events")
+        try:
+            # Send the current state first; subscribing before this read
+            # means a transition in between is delivered, not lost
             job_data = redis_client.hgetall(f"job:{job_id}")
             if not job_data:
                 yield f"data: {json.dumps({'error': 'Job not found'})}\n\n"
-                break
-                
+                return
+
             # Convert bytes to strings
             result = {k.decode('utf-8'): v.decode('utf-8') for k, v in job_data.items()}
-            status = result.get('status')
-            
-            # Only send update if status has changed
-            if status != last_status:
+            yield f"data: {json.dumps(result)}\n\n"
+            if result.get('status') in ['completed', 'failed']:
+                return
+
+            deadline = time.time() + 600  # 10 minutes max per connection
+            while time.time() < deadline:
+                message = pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+
+                payload = message['data']
+                event = json.loads(payload.decode('utf-8') if isinstance(payload, bytes) else payload)
+                result.update({k: str(v) for k, v in event.items()})
                 yield f"data: {json.dumps(result)}\n\n"
-                last_status = status
-                
-            # If job completed or failed, we're done
-            if status in ['completed', 'failed']:
-                break
-                
-            time.sleep(1)
-            retry_count += 1
-            
-        # Final update if we timed out
-        if retry_count >= max_retries:
+
+                # If job completed or failed, we're done
+                if result.get('status') in ['completed', 'failed']:
+                    return
+
+            # Final update if we timed out
             yield f"data: {json.dumps({'error': 'Timeout waiting for job completion'})}\n\n"
-    
+        finally:
+            pubsub.close()
+
     return Response(generate(), mimetype='text/event-stream')
 
 if __name__ == '__main__':
-    # Set default port and debug settings from environment
-    port = int(os.environ.get('PORT', 5000))
-    debug = os.environ.get('DEBUG', 'False').lower() == 'true'
-    
-    app.run(debug=debug, port=port, threaded=True)
\ No newline at end of file
+    if os.environ.get('FLASK_DEV'):
+        # Werkzeug's dev server caps concurrency at a handful of threads;
+        # it's for local development only.
+        port = int(os.environ.get('PORT', 5000))
+        debug = os.environ.get('DEBUG', 'False').lower() == 'true'
+
+        app.run(debug=debug, port=port, threaded=True)
+    else:
+        print("In production, run under Gunicorn: gunicorn -c gunicorn.conf.py app:app\n"
+              "For local development, set FLASK_DEV=1 to use the built-in server.")
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""Gunicorn configuration for the compression API.
+
+Run with: gunicorn -c gunicorn.conf.py app:app
+
+gevent workers are preferred when installed: every /job/<id>/stream SSE
+client otherwise pins an OS thread for up to ten minutes, so a few dozen
+open streams exhaust a gthread worker while greenlets handle thousands of
+mostly-idle connections per process. Gunicorn's gevent worker
+monkey-patches the stdlib before loading the app, which makes the Redis
+sockets in the SSE loop cooperative without any app changes. The trade-off
+is that image encodes, though they release the GIL in native code, never
+yield the event loop mid-call - deployments that are encode-bound rather
+than SSE-bound can force threads back with WORKER_CLASS=gthread.
+"""
+import os
+
+workers = max(2, (os.cpu_count() or 2) // 2)
+timeout = 300  # large uploads on slow links can legitimately take minutes
+graceful_timeout = 60
+keepalive = 5
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+worker_class = os.environ.get('WORKER_CLASS')
+if worker_class is None:
+    try:
+        import gevent  # noqa: F401
+        worker_class = 'gevent'
+    except ImportError:
+        worker_class = 'gthread'
+
+if worker_class == 'gevent':
+    # Shared with app.py, which sizes its Redis pool from the same budget
+    # (each SSE client pins a pub/sub connection for the life of its stream).
+    worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+else:
+    threads = 4